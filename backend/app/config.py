@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
+from functools import lru_cache
 import os
 
 load_dotenv()
@@ -34,12 +35,24 @@ class Settings(BaseSettings):
     RETINAFACE_WEIGHTS: str = "retinaface_resnet50"
     ARCFACE_WEIGHTS: str = "arcface_resnet50"
     VIT_EMOTION_WEIGHTS: str = "vit_emotion"
+    # cpu | cuda | cuda_fp16 (CUDA options fall back to cpu when no GPU is present)
+    INFERENCE_DEVICE: str = os.getenv("INFERENCE_DEVICE", "cpu")
     
     # Processing
     MAX_IMAGES_TO_PROCESS: int = 50
+    MAX_FACES_PER_IMAGE: int = int(os.getenv("MAX_FACES_PER_IMAGE", "5"))
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
     FACE_SIMILARITY_THRESHOLD: float = 0.6
+    FACE_INDEX_CACHE_PATH: str = os.getenv("FACE_INDEX_CACHE_PATH", "./cache/face_index.npz")
+    # Each worker holds its own face index; this is how often it pulls in faces stored by the others
+    FACE_INDEX_SYNC_SECONDS: int = int(os.getenv("FACE_INDEX_SYNC_SECONDS", "30"))
     EMOTION_CONFIDENCE_THRESHOLD: float = 0.3
     
+    # Server
+    # WEB_CONCURRENCY is also what the uvicorn CLI (Docker CMD) reads for --workers
+    WORKERS: int = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+    GZIP_MIN_SIZE: int = 1024
+    
     # Session
     SESSION_EXPIRY_HOURS: int = 24
     SESSION_CLEANUP_INTERVAL_HOURS: int = 1
@@ -63,4 +76,9 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings instance (built once, usable with Depends)"""
+    return Settings()
+
+settings = get_settings()
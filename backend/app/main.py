@@ -1,37 +1,74 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+import contextlib
+from functools import lru_cache
 import logging
 import asyncio
 
 from app.config import settings
+from app.middleware.gzip_json import JSONGZipMiddleware
+from app.middleware.upload_limit import UploadLimitMiddleware
 from app.routes import search, health
 from app.utils.logger import setup_logger
 from app.services.db_init import init_db, get_db_status
+from app.services.database import build_face_index, save_face_index, sync_face_index
 from app.services.image_storage import cleanup_old_sessions
 
 # Setup logging
 logger = setup_logger(__name__)
 
-# Startup/Shutdown events
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Handle startup and shutdown events"""
-    # ========== STARTUP ==========
-    logger.info("=" * 60)
-    logger.info("🚀 RIVION Face Emotion Detection API Starting...")
-    logger.info("=" * 60)
+# Upper bound (seconds) for the backoff between database init attempts
+DB_INIT_MAX_RETRY_DELAY = 30
+
+def _warmup_models() -> str:
+    """
+    Import the inference services (model singletons load at import) and run one dummy pass each
+    
+    Returns:
+        The device/precision the emotion model resolved to (after any CPU fallback)
+    """
+    from app.services import embedding, emotion, face_detection
+    
+    face_detection.warmup()
+    emotion.warmup()
+    embedding.warmup()
+    return f"{emotion.DEVICE} ({emotion.DTYPE})"
+
+async def _deferred_init(app: FastAPI):
+    """Initialize the database after the server has started accepting connections"""
+    # Retry until the database is reachable; the worker stays not-ready
+    # (503 on /api/health/ready) in the meantime instead of giving up for good
+    delay = 1
+    while True:
+        try:
+            logger.info("📊 Initializing database...")
+            await asyncio.to_thread(init_db)
+            db_status = await asyncio.to_thread(get_db_status)
+            logger.info(f"✅ Database Status: {db_status['status']}")
+            logger.info(f"   Tables: {db_status.get('count', 0)} tables found")
+            break
+        except Exception as e:
+            logger.error(f"❌ Database initialization failed: {e} (retrying in {delay}s)")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DB_INIT_MAX_RETRY_DELAY)
+    
+    # Load the saved similarity index and catch up on newer embeddings
+    # (full rebuild from the database when there is no saved copy)
+    try:
+        indexed = await asyncio.to_thread(build_face_index, settings.FACE_INDEX_CACHE_PATH)
+        logger.info(f"🔎 Face index: {indexed} embeddings loaded from database")
+    except Exception as e:
+        logger.warning(f"⚠️ Face index build failed: {e}")
     
-    # Initialize Database
+    # Load and warm the inference models once per worker, off the event loop
     try:
-        logger.info("📊 Initializing database...")
-        init_db()
-        db_status = get_db_status()
-        logger.info(f"✅ Database Status: {db_status['status']}")
-        logger.info(f"   Tables: {db_status.get('count', 0)} tables found")
+        device = await asyncio.to_thread(_warmup_models)
+        logger.info("🔥 Inference models warmed up")
+        logger.info(f"🧠 Inference Device: {device} (requested {settings.INFERENCE_DEVICE})")
     except Exception as e:
-        logger.error(f"❌ Database initialization failed: {e}")
-        raise
+        logger.warning(f"⚠️ Model warmup failed: {e}")
     
     # Log configuration
     logger.info(f"🗂️  Storage Directory: {settings.STORAGE_DIR}")
@@ -39,8 +76,37 @@ async def lifespan(app: FastAPI):
     logger.info(f"🔗 Allowed CORS Origins: {settings.CORS_ORIGINS}")
     logger.info(f"⏰ Session Expiry: {settings.SESSION_EXPIRY_HOURS} hours")
     
+    app.state.ready = True
     logger.info("✅ Application Ready!")
     logger.info("=" * 60)
+
+async def _face_index_sync_loop(app: FastAPI):
+    """Periodically add faces stored by other workers to this worker's index"""
+    while True:
+        await asyncio.sleep(settings.FACE_INDEX_SYNC_SECONDS)
+        if not app.state.ready:
+            continue
+        try:
+            added = await asyncio.to_thread(sync_face_index)
+            if added:
+                logger.info("🔎 Face index sync: %s new embeddings", added)
+        except Exception as e:
+            logger.warning("⚠️ Face index sync failed: %s", e)
+
+# Startup/Shutdown events
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Handle startup and shutdown events"""
+    # ========== STARTUP ==========
+    logger.info("=" * 60)
+    logger.info("🚀 RIVION Face Emotion Detection API Starting...")
+    logger.info("=" * 60)
+    
+    # Database init runs in the background so the socket binds immediately;
+    # readiness is reported through /api/health/ready until it completes.
+    app.state.ready = False
+    init_task = asyncio.create_task(_deferred_init(app))
+    sync_task = asyncio.create_task(_face_index_sync_loop(app))
     
     yield
     
@@ -48,6 +114,19 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 60)
     logger.info("🛑 RIVION API Shutting Down...")
     
+    for task in (init_task, sync_task):
+        if not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    
+    # Persist the similarity index for a fast next startup
+    try:
+        if await asyncio.to_thread(save_face_index, settings.FACE_INDEX_CACHE_PATH):
+            logger.info(f"💾 Face index saved to {settings.FACE_INDEX_CACHE_PATH}")
+    except Exception as e:
+        logger.warning(f"⚠️ Face index save failed: {e}")
+    
     # Cleanup old sessions
     try:
         deleted = await cleanup_old_sessions(hours=settings.SESSION_EXPIRY_HOURS)
@@ -58,29 +137,7 @@ async def lifespan(app: FastAPI):
     logger.info("✅ Shutdown Complete")
     logger.info("=" * 60)
 
-# Create FastAPI app
-app = FastAPI(
-    title=settings.API_TITLE,
-    version=settings.API_VERSION,
-    description=settings.API_DESCRIPTION,
-    lifespan=lifespan,
-)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include routes
-app.include_router(health.router, prefix="/api", tags=["health"])
-app.include_router(search.router, prefix="/api/v1", tags=["search"])
-
 # Root endpoint
-@app.get("/")
 async def root():
     """Root endpoint - shows API info"""
     return {
@@ -96,7 +153,6 @@ async def root():
     }
 
 # Status endpoint
-@app.get("/api/v1/status")
 async def status():
     """Get system status"""
     return {
@@ -109,12 +165,62 @@ async def status():
         "session_expiry_hours": settings.SESSION_EXPIRY_HOURS,
     }
 
+@lru_cache(maxsize=1)
+def create_app() -> FastAPI:
+    """Build the FastAPI application (lifespan -> middleware -> routes), once per process"""
+    app = FastAPI(
+        title=settings.API_TITLE,
+        version=settings.API_VERSION,
+        description=settings.API_DESCRIPTION,
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
+    
+    # Middleware added later wraps the earlier ones: CORS goes last so its
+    # headers also reach responses produced by the other middleware (e.g. 413)
+    
+    # Refuse oversized uploads from the Content-Length header before the body is read
+    app.add_middleware(UploadLimitMiddleware, max_body_bytes=settings.MAX_UPLOAD_BYTES)
+    
+    # Compress JSON bodies (similar_faces lists, emotion distributions) above 1 KB;
+    # session images are already JPEG-compressed and pass through
+    app.add_middleware(JSONGZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Include routes
+    app.include_router(health.router, prefix="/api", tags=["health"])
+    # search.router carries its own "/v1" prefix
+    app.include_router(search.router, prefix="/api", tags=["search"])
+    app.add_api_route("/", root, methods=["GET"])
+    app.add_api_route("/api/v1/status", status, methods=["GET"])
+    
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
+    import os
     import uvicorn
+    
+    # DEV=1 keeps the single-process auto-reload server; otherwise run
+    # settings.WORKERS workers (WEB_CONCURRENCY, one per CPU if unset)
+    dev_mode = bool(os.getenv("DEV"))
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=dev_mode,
+        workers=None if dev_mode else settings.WORKERS,
+        # "auto" picks uvloop/httptools when installed (not on Windows)
+        loop="auto",
+        http="auto",
         log_level="info",
     )
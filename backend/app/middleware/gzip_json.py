@@ -0,0 +1,84 @@
+import gzip
+import io
+
+from starlette.datastructures import Headers, MutableHeaders
+
+class JSONGZipMiddleware:
+    """
+    Gzip JSON responses only
+
+    Images and other already-compressed bodies would cost CPU to recompress
+    for no size gain, so they are sent as-is. Bodies smaller than
+    `minimum_size` and responses that already carry a Content-Encoding are
+    also passed through.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, compresslevel: int = 9):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("accept-encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compress = False
+        gzip_buffer = gzip_file = None
+
+        async def send_maybe_gzipped(message):
+            nonlocal start_message, compress, gzip_buffer, gzip_file
+
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body chunk shows whether to compress
+                headers = Headers(raw=message["headers"])
+                compress = (
+                    headers.get("content-type", "").startswith("application/json")
+                    and "content-encoding" not in headers
+                )
+                if not compress:
+                    await send(message)
+                    return
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or not compress:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                # First body chunk: send the held headers, compressed or not
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more_body:
+                    if len(body) >= self.minimum_size:
+                        body = gzip.compress(body, compresslevel=self.compresslevel)
+                        headers["Content-Encoding"] = "gzip"
+                        headers["Content-Length"] = str(len(body))
+                        headers.add_vary_header("Accept-Encoding")
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    start_message = None
+                    return
+
+                # Streamed: the compressed length isn't known up front
+                headers["Content-Encoding"] = "gzip"
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                gzip_buffer = io.BytesIO()
+                gzip_file = gzip.GzipFile(mode="wb", fileobj=gzip_buffer, compresslevel=self.compresslevel)
+                await send(start_message)
+                start_message = None
+
+            gzip_file.write(body)
+            if not more_body:
+                gzip_file.close()
+            chunk = gzip_buffer.getvalue()
+            gzip_buffer.seek(0)
+            gzip_buffer.truncate()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_maybe_gzipped)
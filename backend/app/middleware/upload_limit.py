@@ -0,0 +1,34 @@
+import logging
+
+from fastapi.responses import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Room for multipart boundaries and the small form fields next to the image
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+class UploadLimitMiddleware:
+    """
+    Reject request bodies whose declared Content-Length exceeds the upload cap
+
+    Runs before FastAPI parses the multipart form, so oversized uploads are
+    refused without reading the body. Uploads without a Content-Length
+    (chunked) are still bounded by the streaming read in the route.
+    """
+
+    def __init__(self, app, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > self.max_body_bytes:
+                        logger.warning("Upload rejected: Content-Length %s", value.decode())
+                        response = ORJSONResponse({"detail": "Image too large"}, status_code=413)
+                        await response(scope, receive, send)
+                        return
+                    break
+
+        await self.app(scope, receive, send)
@@ -1,11 +1,31 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import ORJSONResponse, Response
+import orjson
 
 router = APIRouter()
 
+# Static health payload, serialized once at import
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "message": "Face Emotion Detection API is running",
+})
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "message": "Face Emotion Detection API is running",
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
+@router.get("/health/live")
+async def liveness():
+    """Liveness probe - the process is up and serving requests"""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    """Readiness probe - 503 until startup initialization has finished"""
+    if not getattr(request.app.state, "ready", False):
+        return ORJSONResponse(
+            status_code=503,
+            content={"status": "starting"}
+        )
+    return {"status": "ready"}
@@ -4,27 +4,50 @@ Handles face capture, emotion analysis, and similarity search
 Compatible with existing emotion.py and services
 """
 
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
-import base64
-import io
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import ORJSONResponse, FileResponse, Response
+from cachetools import LRUCache
+import asyncio
+from functools import lru_cache
+import hashlib
+import orjson
+import os
 import uuid
 from datetime import datetime
 import logging
-from PIL import Image
-import numpy as np
-import os
 
-# Import your existing services (matching your actual code)
-from app.services.emotion import analyze_emotion, aggregate_emotions
+from app.config import settings
+from app.utils.validators import IMAGE_MEDIA_TYPES, SNIFF_BYTES, is_image_content_type, sniff_image_type
+
+# NOTE: the inference services (emotion, embedding, face_detection) pull in
+# torch/torchvision and OpenCV, so they are imported inside the handlers that
+# need them instead of at module load. This keeps `uvicorn` boot (and
+# health-check-only traffic) free of the ML import cost. The database service
+# is already loaded by app.main at startup; its handler-level imports are
+# only for locality.
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/v1", tags=["face-emotion"])
 
+# Static health payload, serialized once at import
+_HEALTH_BODY = orjson.dumps({
+    "status": "healthy",
+    "service": "face-emotion-analyzer",
+})
+
+# Per-image inference results keyed by a blake2b digest of the upload bytes;
+# only touched from the event loop, so no locking is needed
+FACE_ANALYSIS_CACHE = LRUCache(maxsize=1024)
+
+# Upload read size; uploads larger than settings.MAX_UPLOAD_BYTES are rejected
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 # ==================== FACE CAPTURE & ANALYSIS ====================
 
 @router.post("/analyze-face")
 async def analyze_face(
+    request: Request,
+    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
     user_name: str = Form(...),
     privacy_agreed: bool = Form(...)
@@ -40,78 +63,161 @@ async def analyze_face(
     Returns:
         JSON with emotion analysis results
     """
+    from app.services.database import get_matched_images
+    from app.services.embedding import extract_embeddings
+    from app.services.emotion import analyze_face_emotions
+    from app.services.face_detection import decode_image, detect_faces_in_image
+    from app.services.image_storage import save_session_image
+
     try:
         # Generate session ID
-        session_id = str(uuid.uuid4())
+        session_id = uuid.uuid4().hex
         
         # Read image file
-        image_data = await image.read()
+        image_data, image_type = await read_upload(image)
         
-        # Save temporary image file
-        temp_dir = "temp_uploads"
-        os.makedirs(temp_dir, exist_ok=True)
+        logger.info("Processing image for session: %s", session_id)
         
-        temp_image_path = os.path.join(temp_dir, f"{session_id}.jpg")
+        # Identical re-uploads (retries, repeated webcam frames) reuse cached
+        # inference results and skip decode, detection and both models
+        cache_key = hashlib.blake2b(image_data, digest_size=16).digest()
+        cached = FACE_ANALYSIS_CACHE.get(cache_key)
         
-        # Write image to temp file
-        with open(temp_image_path, 'wb') as f:
-            f.write(image_data)
-        
-        # Convert to base64
-        base64_image = base64.b64encode(image_data).decode('utf-8')
-        
-        logger.info(f"Processing image for session: {session_id}")
+        if cached is not None:
+            faces_detected, emotion_results, face_embeddings = cached
+            image_path = await save_session_image(image_data, session_id, image_type)
+        else:
+            # Decode once (OpenCV decodes straight into a BGR numpy array)
+            image_array = await asyncio.to_thread(decode_image, image_data)
+            
+            if image_array is None:
+                logger.warning("Could not decode image for session %s", session_id)
+                return ORJSONResponse(
+                    status_code=400,
+                    content={
+                        "success": False,
+                        "error": "Could not read the image. Please upload a JPG or PNG.",
+                        "session_id": session_id
+                    }
+                )
+            
+            # Detect faces
+            face_detections = await asyncio.to_thread(detect_faces_in_image, image_array)
+            
+            if not face_detections:
+                logger.warning("No faces detected in session %s", session_id)
+                return ORJSONResponse(
+                    status_code=400,
+                    content={
+                        "success": False,
+                        "error": "No face detected in the image. Please try again.",
+                        "session_id": session_id
+                    }
+                )
+            
+            # Detections come largest-first; analyze only the top-K so crowd
+            # photos don't multiply inference cost (faces_detected keeps the total)
+            faces_detected = len(face_detections)
+            if faces_detected > settings.MAX_FACES_PER_IMAGE:
+                logger.info(
+                    "Dropping %s smaller faces in session %s",
+                    faces_detected - settings.MAX_FACES_PER_IMAGE, session_id
+                )
+                face_detections = face_detections[:settings.MAX_FACES_PER_IMAGE]
+            
+            # Batched emotion + embedding inference (one model call each for all
+            # faces) and the image save are independent; run them concurrently
+            emotion_results, face_embeddings, image_path = await asyncio.gather(
+                asyncio.to_thread(analyze_face_emotions, face_detections),
+                asyncio.to_thread(extract_embeddings, face_detections),
+                save_session_image(image_data, session_id, image_type)
+            )
+            
+            # Don't pin failed inference results in the cache
+            if all(confidence > 0 for _, _, confidence in emotion_results):
+                FACE_ANALYSIS_CACHE[cache_key] = (faces_detected, emotion_results, face_embeddings)
         
-        # Analyze emotion using existing function
-        dominant_emotion, emotion_dist, confidence = analyze_emotion(temp_image_path)
+        logger.info("Found %s face(s) in session %s", faces_detected, session_id)
         
-        if dominant_emotion == 'neutral' and confidence == 0.0:
-            logger.warning(f"Emotion analysis failed for session {session_id}")
-            return JSONResponse(
+        # A failed inference comes back as ('neutral', {}, 0.0); don't report
+        # it as a result or store it (and its face) for this session
+        if any(confidence == 0.0 for _, _, confidence in emotion_results):
+            logger.warning("Emotion analysis failed for session %s", session_id)
+            return ORJSONResponse(
                 status_code=400,
                 content={
                     "success": False,
-                    "error": "Could not analyze image. Please ensure it contains a clear face.",
+                    "error": "Could not analyze image",
                     "session_id": session_id
                 }
             )
         
-        logger.info(f"Emotion analysis for session {session_id}: {dominant_emotion} ({confidence*100:.1f}%)")
+        emotions_data = []
+        for idx, (dominant_emotion, emotion_dist, confidence) in enumerate(emotion_results):
+            emotions_data.append({
+                "dominant_emotion": dominant_emotion,
+                "confidence": confidence,
+                "all_emotions": emotion_dist,
+            })
+            logger.info("Emotion analysis for face %s: %s (%.1f%%)", idx + 1, dominant_emotion, confidence * 100)
         
-        # Generate emotion statement
-        emotion_statement = generate_emotion_statement(dominant_emotion, confidence)
+        # Aggregate emotion across faces
+        aggregated = aggregate_emotions(emotions_data)
+        
+        # The DB writes don't feed the response: run them after it is sent.
+        # Only the similarity search stays on the request path.
+        background_tasks.add_task(
+            store_session_data,
+            session_id=session_id,
+            user_name=user_name,
+            image_path=image_path,
+            privacy_agreed=privacy_agreed,
+            embedding=face_embeddings[0],
+            emotions_data=emotions_data,
+            aggregated=aggregated
+        )
+        
+        try:
+            similar_faces = await asyncio.to_thread(
+                get_matched_images,
+                embedding=face_embeddings[0],
+                limit=5,
+                threshold=settings.FACE_SIMILARITY_THRESHOLD,
+                exclude_session_id=session_id
+            )
+            similar_faces = with_image_urls(request, similar_faces)
+            logger.info("Found %s similar faces", len(similar_faces))
+        except Exception as e:
+            logger.warning("Error searching similar faces: %s", e)
+            similar_faces = []
         
         # Prepare response
         response_data = {
             "success": True,
             "session_id": session_id,
             "user_name": user_name,
-            "dominant_emotion": dominant_emotion,
-            "emotion_confidence": float(confidence),
-            "all_emotions": emotion_dist,
-            "statement": emotion_statement,
+            "faces_detected": faces_detected,
+            "dominant_emotion": aggregated['dominant_emotion'],
+            "emotion_confidence": aggregated['confidence'],
+            "all_emotions": aggregated['all_emotions'],
+            "statement": aggregated['statement'],
+            "similar_faces": similar_faces,
             "captured_at": datetime.utcnow().isoformat(),
-            "image_base64": base64_image,
-            "temp_image_path": temp_image_path
+            "image_path": image_path
         }
         
-        logger.info(f"Analysis complete for session {session_id}")
+        logger.info("Analysis complete for session %s", session_id)
         
-        # Clean up temp file
-        try:
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-        except Exception as e:
-            logger.warning(f"Could not delete temp file: {e}")
-        
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=200,
             content=response_data
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error analyzing face: {str(e)}", exc_info=True)
-        return JSONResponse(
+        logger.error("Error analyzing face: %s", e, exc_info=True)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -122,6 +228,7 @@ async def analyze_face(
 
 @router.post("/search")
 async def search_faces(
+    request: Request,
     image: UploadFile = File(...),
     user_name: str = Form(...)
 ):
@@ -135,27 +242,69 @@ async def search_faces(
     Returns:
         Emotion analysis and similar faces
     """
+    from app.services.database import get_matched_images
+    from app.services.embedding import extract_embedding
+    from app.services.emotion import analyze_image_emotion
+    from app.services.face_detection import decode_image, detect_faces_in_image
+
     try:
-        image_data = await image.read()
+        image_data, _ = await read_upload(image)
         
-        # Save temporary image file
-        temp_dir = "temp_uploads"
-        os.makedirs(temp_dir, exist_ok=True)
+        session_id = uuid.uuid4().hex
         
-        session_id = str(uuid.uuid4())
-        temp_image_path = os.path.join(temp_dir, f"{session_id}.jpg")
+        logger.info("Searching similar faces for user: %s", user_name)
         
-        with open(temp_image_path, 'wb') as f:
-            f.write(image_data)
+        # Decode once and share the array between detection and emotion analysis
+        image_array = await asyncio.to_thread(decode_image, image_data)
         
-        logger.info(f"Searching similar faces for user: {user_name}")
+        if image_array is None:
+            logger.warning("Could not decode image for user %s", user_name)
+            return ORJSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "error": "Could not read the image",
+                    "similar_faces": []
+                }
+            )
+        
+        # Detect faces
+        face_detections = await asyncio.to_thread(detect_faces_in_image, image_array)
+        
+        if not face_detections:
+            logger.warning("No faces detected for user %s", user_name)
+            return ORJSONResponse(
+                status_code=400,
+                content={
+                    "success": False,
+                    "error": "No face detected",
+                    "similar_faces": []
+                }
+            )
         
-        # Analyze emotion
-        dominant_emotion, emotion_dist, confidence = analyze_emotion(temp_image_path)
+        def find_similar_faces(face_img):
+            embedding = extract_embedding(face_img)
+            return get_matched_images(
+                embedding=embedding,
+                limit=10,
+                threshold=0.5
+            )
+        
+        # Emotion analysis and the similarity search are independent, so run
+        # them concurrently; a failed search must not discard the emotion result
+        emotion_result, similar_faces = await asyncio.gather(
+            asyncio.to_thread(analyze_image_emotion, image_array),
+            asyncio.to_thread(find_similar_faces, face_detections[0]),
+            return_exceptions=True
+        )
+        
+        if isinstance(emotion_result, Exception):
+            raise emotion_result
+        dominant_emotion, emotion_dist, confidence = emotion_result
         
         if dominant_emotion == 'neutral' and confidence == 0.0:
-            logger.warning(f"Analysis failed for user {user_name}")
-            return JSONResponse(
+            logger.warning("Analysis failed for user %s", user_name)
+            return ORJSONResponse(
                 status_code=400,
                 content={
                     "success": False,
@@ -164,40 +313,41 @@ async def search_faces(
                 }
             )
         
-        logger.info(f"Found emotion: {dominant_emotion}")
+        logger.info("Found emotion: %s", dominant_emotion)
         
         emotion_statement = generate_emotion_statement(dominant_emotion, confidence)
         
-        # For now, return empty similar faces (implement with vector DB later)
-        similar_faces = []
+        if isinstance(similar_faces, Exception):
+            logger.warning("Error searching similar faces: %s", similar_faces)
+            similar_faces = []
+        else:
+            similar_faces = with_image_urls(request, similar_faces)
+        
+        logger.info("Found %s similar faces", len(similar_faces))
         
         response_data = {
             "success": True,
             "user_name": user_name,
             "session_id": session_id,
+            "faces_detected": len(face_detections),
             "dominant_emotion": dominant_emotion,
-            "emotion_confidence": float(confidence),
+            "emotion_confidence": confidence,
             "all_emotions": emotion_dist,
             "statement": emotion_statement,
             "similar_faces": similar_faces,
             "searched_at": datetime.utcnow().isoformat()
         }
         
-        # Clean up temp file
-        try:
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-        except Exception as e:
-            logger.warning(f"Could not delete temp file: {e}")
-        
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=200,
             content=response_data
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error searching faces: {str(e)}", exc_info=True)
-        return JSONResponse(
+        logger.error("Error searching faces: %s", e, exc_info=True)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -208,40 +358,209 @@ async def search_faces(
 
 
 @router.get("/sessions/{session_id}")
-async def get_session(session_id: str):
-    """Get session details by session ID"""
+async def get_session(session_id: str, request: Request):
+    """Get session details by session ID (supports If-None-Match)"""
     try:
-        logger.info(f"Fetching session: {session_id}")
+        logger.info("Fetching session: %s", session_id)
         
-        return JSONResponse(
+        etag = await asyncio.to_thread(session_etag, session_id)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        return ORJSONResponse(
             status_code=200,
             content={
                 "session_id": session_id,
                 "status": "Session retrieved successfully"
-            }
+            },
+            headers={"ETag": etag}
         )
     except Exception as e:
-        logger.error(f"Error fetching session: {str(e)}")
-        return JSONResponse(
+        logger.error("Error fetching session: %s", e)
+        return ORJSONResponse(
             status_code=500,
             content={"error": "Error fetching session"}
         )
 
 
+@router.get("/sessions/{session_id}/image")
+async def get_session_image(session_id: str):
+    """Stream the captured image for a session"""
+    from app.services.image_storage import get_session_files
+
+    try:
+        # Accepts both the hex ids issued now and older dashed ids
+        uuid.UUID(session_id)
+    except ValueError:
+        return ORJSONResponse(
+            status_code=404,
+            content={"error": "Session image not found"}
+        )
+    
+    files = await get_session_files(session_id)
+    if not files:
+        return ORJSONResponse(
+            status_code=404,
+            content={"error": "Session image not found"}
+        )
+    
+    # Served with the media type of the format it was saved as
+    path = files[0]['path']
+    media_type = IMAGE_MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+    return FileResponse(path, media_type=media_type)
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return JSONResponse(
-        status_code=200,
-        content={
-            "status": "healthy",
-            "service": "face-emotion-analyzer",
-            "timestamp": datetime.utcnow().isoformat()
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
+
+# ==================== HELPER FUNCTIONS ====================
+
+def session_etag(session_id: str) -> str:
+    """Build an ETag from the session ID and its storage directory mtime"""
+    session_dir = os.path.join(settings.STORAGE_DIR, 'sessions', session_id)
+    try:
+        mtime = os.stat(session_dir).st_mtime_ns
+    except OSError:
+        mtime = 0
+    
+    digest = hashlib.md5(f"{session_id}:{mtime}".encode()).hexdigest()
+    return f'"{digest}"'
+
+def with_image_urls(request: Request, similar_faces: list) -> list:
+    """Add an absolute `image_url` (served by get_session_image) to each similarity match"""
+    for face in similar_faces:
+        face['image_url'] = str(request.url_for("get_session_image", session_id=face['image_id']))
+    return similar_faces
+
+async def read_upload(image: UploadFile) -> tuple:
+    """
+    Read an uploaded file in chunks with a size cap
+    
+    Returns:
+        (image bytes, image type as returned by sniff_image_type)
+    
+    Raises:
+        HTTPException(413) as soon as the upload exceeds settings.MAX_UPLOAD_BYTES
+        HTTPException(415) if the upload is not a JPEG, PNG or WEBP image
+    """
+    if not is_image_content_type(image.content_type):
+        raise HTTPException(status_code=415, detail="Unsupported image type")
+    if image.size is not None and image.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
+    
+    # Check the magic bytes on the first chunk, before buffering the rest
+    buffer = bytearray(await image.read(UPLOAD_CHUNK_SIZE))
+    image_type = sniff_image_type(buffer[:SNIFF_BYTES])
+    if image_type is None:
+        raise HTTPException(status_code=415, detail="Unsupported image type")
+    
+    while chunk := await image.read(UPLOAD_CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > settings.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Image too large")
+    
+    return bytes(buffer), image_type
+
+
+def store_session_data(session_id: str, user_name: str, image_path: str, privacy_agreed: bool,
+                       embedding, emotions_data: list, aggregated: dict):
+    """
+    Persist an analyzed session (runs as a background task after the response)
+    
+    The emotion inserts log and swallow their own errors; the session insert
+    re-raises, so it is caught here to keep the other writes going.
+    """
+    from app.services.database import (
+        insert_session_user, insert_emotion_logs_bulk, insert_aggregated_emotion
+    )
+    
+    try:
+        insert_session_user(
+            session_id=session_id,
+            user_name=user_name,
+            image_path=image_path,
+            privacy_policy_agreed=privacy_agreed,
+            embedding=embedding
+        )
+    except Exception as e:
+        logger.error("Error storing session data for %s: %s", session_id, e)
+    
+    insert_emotion_logs_bulk([
+        {
+            "image_id": f"{session_id}_face_{idx}",
+            "session_id": session_id,
+            "emotion_label": emotion['dominant_emotion'],
+            "confidence": emotion['confidence'],
+            "emotion_distribution": emotion['all_emotions'],
         }
+        for idx, emotion in enumerate(emotions_data)
+    ])
+    
+    insert_aggregated_emotion(
+        session_id=session_id,
+        dominant_emotion=aggregated['dominant_emotion'],
+        emotion_confidence=aggregated['confidence'],
+        emotion_distribution=aggregated['all_emotions'],
+        statement=aggregated['statement']
     )
 
 
-# ==================== HELPER FUNCTIONS ====================
+def aggregate_emotions(emotions_list):
+    """
+    Aggregate emotions from multiple faces
+    
+    Args:
+        emotions_list: List of per-face emotion results
+    
+    Returns:
+        Aggregated emotion data
+    """
+    if not emotions_list:
+        return {
+            "dominant_emotion": "neutral",
+            "confidence": 0.0,
+            "all_emotions": {},
+            "statement": "Unable to analyze emotion"
+        }
+    
+    # If single face, return its emotion
+    if len(emotions_list) == 1:
+        emotion = emotions_list[0]
+        return {
+            "dominant_emotion": emotion['dominant_emotion'],
+            "confidence": emotion['confidence'],
+            "all_emotions": emotion['all_emotions'],
+            "statement": generate_emotion_statement(emotion['dominant_emotion'], emotion['confidence'])
+        }
+    
+    # If multiple faces, average emotions
+    from app.services.emotion import average_emotions
+    
+    dominant_emotion, confidence, avg_emotions = average_emotions(
+        [emotion_data['all_emotions'] for emotion_data in emotions_list]
+    )
+    
+    return {
+        "dominant_emotion": dominant_emotion,
+        "confidence": confidence,
+        "all_emotions": avg_emotions,
+        "statement": generate_emotion_statement(dominant_emotion, confidence)
+    }
+
+
+EMOTION_DESCRIPTIONS = {
+    "happy": "😊 You look happy and cheerful!",
+    "sad": "😔 You seem to be feeling sad.",
+    "angry": "😠 You appear to be feeling angry.",
+    "fear": "😟 You seem fearful or anxious.",
+    "surprise": "😮 You look surprised!",
+    "disgust": "😕 You seem disgusted.",
+    "neutral": "😐 Your expression is neutral.",
+}
+
 
 def generate_emotion_statement(emotion: str, confidence: float) -> str:
     """
@@ -254,18 +573,13 @@ def generate_emotion_statement(emotion: str, confidence: float) -> str:
     Returns:
         Human-readable statement with emoji
     """
-    emotion_descriptions = {
-        "happy": "😊 You look happy and cheerful!",
-        "sad": "😔 You seem to be feeling sad.",
-        "angry": "😠 You appear to be feeling angry.",
-        "fear": "😟 You seem fearful or anxious.",
-        "surprise": "😮 You look surprised!",
-        "disgust": "😕 You seem disgusted.",
-        "neutral": "😐 Your expression is neutral.",
-        "disgust": "😕 You seem disgusted."
-    }
-    
-    confidence_pct = int(confidence * 100)
-    base_statement = emotion_descriptions.get(emotion, "Your emotional state is unclear.")
+    return _emotion_statement(emotion, int(confidence * 100))
+
+
+# 7 labels x 101 whole-percent values (plus unknown labels) fit without eviction
+@lru_cache(maxsize=1024)
+def _emotion_statement(emotion: str, confidence_pct: int) -> str:
+    """Build the statement for an emotion and whole-percent confidence (memoized)"""
+    base_statement = EMOTION_DESCRIPTIONS.get(emotion, "Your emotional state is unclear.")
     
     return f"{base_statement} (Confidence: {confidence_pct}%)"
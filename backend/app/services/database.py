@@ -6,6 +6,7 @@ import json
 import logging
 import numpy as np
 from app.config import settings
+from app.services import faiss_index
 
 logger = logging.getLogger(__name__)
 
@@ -47,19 +48,24 @@ class SessionAggregatedEmotion(Base):
     statement = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-# Create tables
-Base.metadata.create_all(engine)
+# Similarity search re-queries at most this many times when stale hits are dropped
+MATCH_SEARCH_ROUNDS = 3
+
+# Index syncs re-read rows from this far before the last sync, so a row stamped
+# just before a sync but committed after it isn't missed (duplicates are skipped)
+FACE_INDEX_SYNC_OVERLAP = timedelta(seconds=60)
 
 # Database operations
-def insert_session_user(session_id: str, user_name: str, captured_image_base64: str, privacy_policy_agreed: bool):
-    """Insert session user"""
+def insert_session_user(session_id: str, user_name: str, image_path: str, privacy_policy_agreed: bool, embedding: np.ndarray = None):
+    """Insert session user (and index its face embedding, if given)"""
     try:
         session = SessionLocal()
         expires_at = datetime.utcnow() + timedelta(hours=settings.SESSION_EXPIRY_HOURS)
         user = SessionUser(
             session_id=session_id,
             user_name=user_name,
-            captured_image_base64=captured_image_base64,
+            captured_image_path=image_path,
+            embedding=np.ascontiguousarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None,
             privacy_policy_agreed=str(privacy_policy_agreed),
             expires_at=expires_at,
             status='searching'
@@ -67,9 +73,11 @@ def insert_session_user(session_id: str, user_name: str, captured_image_base64:
         session.add(user)
         session.commit()
         session.close()
-        logger.info(f"Session user inserted: {session_id}")
+        if embedding is not None:
+            faiss_index.add_embedding(session_id, embedding)
+        logger.info("Session user inserted: %s", session_id)
     except Exception as e:
-        logger.error(f"Error inserting session user: {e}")
+        logger.error("Error inserting session user: %s", e)
         raise
 
 def insert_emotion_log(image_id: str, session_id: str, emotion_label: str, confidence: float, emotion_distribution: dict):
@@ -78,7 +86,7 @@ def insert_emotion_log(image_id: str, session_id: str, emotion_label: str, confi
         import uuid
         session = SessionLocal()
         log = EmotionLog(
-            emotion_id=str(uuid.uuid4()),
+            emotion_id=uuid.uuid4().hex,
             image_id=image_id,
             session_id=session_id,
             emotion_label=emotion_label,
@@ -88,9 +96,31 @@ def insert_emotion_log(image_id: str, session_id: str, emotion_label: str, confi
         session.add(log)
         session.commit()
         session.close()
-        logger.info(f"Emotion log inserted: {emotion_label}")
+        logger.info("Emotion log inserted: %s", emotion_label)
     except Exception as e:
-        logger.error(f"Error inserting emotion log: {e}")
+        logger.error("Error inserting emotion log: %s", e)
+
+def insert_emotion_logs_bulk(rows: list):
+    """Insert several emotion logs in one transaction (one round trip for all faces)"""
+    try:
+        import uuid
+        session = SessionLocal()
+        session.add_all([
+            EmotionLog(
+                emotion_id=uuid.uuid4().hex,
+                image_id=row['image_id'],
+                session_id=row['session_id'],
+                emotion_label=row['emotion_label'],
+                confidence=row['confidence'],
+                emotion_distribution=row['emotion_distribution'],
+            )
+            for row in rows
+        ])
+        session.commit()
+        session.close()
+        logger.info("Emotion logs inserted: %s", len(rows))
+    except Exception as e:
+        logger.error("Error inserting emotion logs: %s", e)
 
 def insert_aggregated_emotion(session_id: str, dominant_emotion: str, emotion_confidence: float, emotion_distribution: dict, statement: str):
     """Insert aggregated emotion"""
@@ -98,7 +128,7 @@ def insert_aggregated_emotion(session_id: str, dominant_emotion: str, emotion_co
         import uuid
         session = SessionLocal()
         agg = SessionAggregatedEmotion(
-            aggregation_id=str(uuid.uuid4()),
+            aggregation_id=uuid.uuid4().hex,
             session_id=session_id,
             dominant_emotion=dominant_emotion,
             emotion_confidence=emotion_confidence,
@@ -108,23 +138,113 @@ def insert_aggregated_emotion(session_id: str, dominant_emotion: str, emotion_co
         session.add(agg)
         session.commit()
         session.close()
-        logger.info(f"Aggregated emotion inserted: {session_id}")
+        logger.info("Aggregated emotion inserted: %s", session_id)
     except Exception as e:
-        logger.error(f"Error inserting aggregated emotion: {e}")
+        logger.error("Error inserting aggregated emotion: %s", e)
 
-def get_matched_images(embedding: np.ndarray, limit: int = 50, threshold: float = 0.6) -> list:
-    """Get matched images from FAISS"""
-    # Placeholder: In real implementation, query FAISS
+def get_matched_images(embedding: np.ndarray, limit: int = 50, threshold: float = 0.6, exclude_session_id: str = None) -> list:
+    """
+    Get matched images from the FAISS face index
+    
+    `embedding` must be L2-normalized float32 (as returned by extract_embeddings);
+    scores are plain inner products, i.e. cosine similarity against `threshold`.
+    Returns `image_id` (the session ID) and `similarity_score` per match; the
+    routes add the absolute `image_url`.
+    """
+    # Over-fetch by one so excluding the caller's own session still yields `limit` results
+    fetch = limit + 1
+    for _ in range(MATCH_SEARCH_ROUNDS):
+        hits = faiss_index.search(embedding, fetch, threshold)
+        candidates = [(session_id, score) for session_id, score in hits if session_id != exclude_session_id]
+        if not candidates:
+            return []
+        
+        session = SessionLocal()
+        try:
+            live = {
+                session_id for session_id, in session.query(SessionUser.session_id).filter(
+                    SessionUser.session_id.in_([session_id for session_id, _ in candidates]),
+                    _not_expired(),
+                )
+            }
+        finally:
+            session.close()
+        
+        # Sessions deleted or expired (possibly by another worker) are dropped
+        # from the index so they stop taking top-k slots, then search again
+        stale = [session_id for session_id, _ in candidates if session_id not in live]
+        if stale:
+            faiss_index.remove(stale)
+        matches = [(session_id, score) for session_id, score in candidates if session_id in live][:limit]
+        if not stale or len(matches) >= limit or len(hits) < fetch:
+            break
+    
     return [
         {
-            'image_id': '1',
-            'image_url': 'https://example.com/image1.jpg',
-            'image_path': '/path/to/image1.jpg',
-            'similarity_score': 0.95,
-        },
-        # ... more images
+            'image_id': session_id,
+            'similarity_score': score,
+        }
+        for session_id, score in matches
     ]
 
+def build_face_index(cache_path: str = None) -> int:
+    """
+    Load stored session embeddings into the FAISS face index
+    
+    With a saved index at `cache_path`, only sessions created since it was
+    last synced are read from the database; otherwise all embeddings are.
+    
+    Returns:
+        Number of embeddings read from the database and indexed
+    """
+    if cache_path and faiss_index.load(cache_path) is not None:
+        return sync_face_index()
+    
+    now = datetime.utcnow()
+    return faiss_index.build_index(_indexable_embeddings(), synced_at=now.isoformat())
+
+def sync_face_index() -> int:
+    """
+    Add sessions created since the index last caught up with the database
+    
+    Each worker holds its own index, so this is also how a worker picks up
+    faces stored by the others.
+    
+    Returns:
+        Number of embeddings added
+    """
+    synced_at = faiss_index.synced_at()
+    if synced_at is None:
+        return 0
+    
+    now = datetime.utcnow()
+    since = datetime.fromisoformat(synced_at) - FACE_INDEX_SYNC_OVERLAP
+    return faiss_index.add_embeddings(_indexable_embeddings(since), synced_at=now.isoformat())
+
+def _not_expired():
+    """Filter for sessions that haven't passed their expires_at"""
+    return (SessionUser.expires_at.is_(None)) | (SessionUser.expires_at > datetime.utcnow())
+
+def _indexable_embeddings(since: datetime = None) -> list:
+    """(session_id, embedding) for live sessions with a stored embedding, optionally created since `since`"""
+    session = SessionLocal()
+    try:
+        query = session.query(SessionUser.session_id, SessionUser.embedding).filter(
+            SessionUser.embedding.isnot(None),
+            _not_expired(),
+        )
+        if since is not None:
+            query = query.filter(SessionUser.created_at >= since)
+        rows = query.all()
+    finally:
+        session.close()
+    
+    return [(session_id, np.frombuffer(embedding, dtype=np.float32)) for session_id, embedding in rows]
+
+def save_face_index(cache_path: str) -> bool:
+    """Persist the FAISS face index so the next startup only catches up on new sessions"""
+    return faiss_index.save(cache_path)
+
 def delete_session(session_id: str):
     """Delete session and related data"""
     try:
@@ -134,6 +254,7 @@ def delete_session(session_id: str):
         session.query(SessionAggregatedEmotion).filter(SessionAggregatedEmotion.session_id == session_id).delete()
         session.commit()
         session.close()
-        logger.info(f"Session deleted: {session_id}")
+        faiss_index.remove([session_id])
+        logger.info("Session deleted: %s", session_id)
     except Exception as e:
-        logger.error(f"Error deleting session: {e}")
+        logger.error("Error deleting session: %s", e)
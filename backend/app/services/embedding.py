@@ -1,6 +1,31 @@
+import threading
+
 import numpy as np
 import cv2
 
+from app.config import settings
+
+# Input size every face crop is resized to
+FACE_SIZE = 128
+HIST_BINS = 256
+EMBEDDING_DIM = 512
+
+# Per-thread resize buffer (requests run in worker threads, so a single
+# module-level buffer would be shared between concurrent calls)
+_buffers = threading.local()
+
+def _face_batch(n: int) -> np.ndarray:
+    """Return this thread's (n, FACE_SIZE, FACE_SIZE, 3) resize buffer, growing it only when needed"""
+    buf = getattr(_buffers, 'faces', None)
+    if buf is None or len(buf) < n:
+        buf = np.empty((max(n, settings.MAX_FACES_PER_IMAGE), FACE_SIZE, FACE_SIZE, 3), dtype=np.uint8)
+        _buffers.faces = buf
+    return buf[:n]
+
+def warmup():
+    """Run one dummy batch through the embedding path (the resize buffers are per thread, so request threads still allocate their own on first use)"""
+    extract_embeddings([np.zeros((FACE_SIZE, FACE_SIZE, 3), dtype=np.uint8)])
+
 def extract_embedding(face_image: np.ndarray) -> np.ndarray:
     """
     Extract a simple embedding from a face image using histogram.
@@ -8,22 +33,39 @@ def extract_embedding(face_image: np.ndarray) -> np.ndarray:
     In production, this would use ArcFace/InsightFace.
     For now, return a normalized histogram (cheap embedding).
     """
+    return extract_embeddings([face_image])[0]
+
+def extract_embeddings(face_images: list) -> np.ndarray:
+    """
+    Extract embeddings for several face images in one batched pass.
+    
+    Returns:
+        (N, 512) float32, C-contiguous, L2-normalized array, one row per input face
+    """
     try:
-        # Resize to 128x128
-        face_resized = cv2.resize(face_image, (128, 128))
+        # Resize every crop to 128x128 straight into the reused (N, H, W, 3) batch
+        n = len(face_images)
+        batch = _face_batch(n)
+        for i, face in enumerate(face_images):
+            cv2.resize(face, (FACE_SIZE, FACE_SIZE), dst=batch[i])
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(face_resized, cv2.COLOR_BGR2GRAY)
+        # Convert to grayscale in one call by treating the batch as a tall image
+        gray = cv2.cvtColor(batch.reshape(n * FACE_SIZE, FACE_SIZE, 3), cv2.COLOR_BGR2GRAY)
+        gray = gray.reshape(n, -1)
         
-        # Compute histogram (poor man's embedding)
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-        hist = cv2.normalize(hist, hist).flatten()
+        # Per-face 256-bin histograms (poor man's embedding): offset each row
+        # into its own bin range so a single bincount covers the whole batch
+        offsets = (np.arange(n) * HIST_BINS)[:, None]
+        hist = np.bincount((gray + offsets).ravel(), minlength=n * HIST_BINS)
+        hist = hist.reshape(n, HIST_BINS).astype(np.float32)
+        hist /= np.maximum(np.linalg.norm(hist, axis=1, keepdims=True), 1e-12)
         
-        # Pad to 512 dims (to match expected embedding size)
-        embedding = np.zeros(512)
-        embedding[:256] = hist
+        # Pad to 512 dims (to match expected embedding size). Zero padding keeps
+        # each row unit-length, so consumers (FAISS, DB) use it as-is
+        embeddings = np.zeros((n, EMBEDDING_DIM), dtype=np.float32)
+        embeddings[:, :HIST_BINS] = hist
         
-        return embedding
+        return embeddings
         
     except Exception as e:
         print(f"Error extracting embedding: {e}")
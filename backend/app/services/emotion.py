@@ -1,28 +1,110 @@
+import cv2
 import torch
 import numpy as np
 from torchvision import transforms
-from PIL import Image
 import logging
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
 # Emotion labels
 EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'neutral', 'sad', 'surprise']
 
+INFERENCE_DEVICES = ('cpu', 'cuda', 'cuda_fp16')
+
+def select_device(name: str) -> tuple:
+    """
+    Resolve an INFERENCE_DEVICE setting to a torch device and dtype
+    
+    Returns:
+        (torch.device, torch.dtype); CUDA requests fall back to (cpu, float32)
+        when no GPU is available
+    """
+    if name not in INFERENCE_DEVICES:
+        logger.warning("Unknown INFERENCE_DEVICE %r, using cpu", name)
+        name = 'cpu'
+    
+    if name.startswith('cuda') and not torch.cuda.is_available():
+        logger.warning("INFERENCE_DEVICE=%s but CUDA is unavailable, using cpu", name)
+        name = 'cpu'
+    
+    if name == 'cpu':
+        return torch.device('cpu'), torch.float32
+    return torch.device('cuda'), torch.float16 if name == 'cuda_fp16' else torch.float32
+
+# The emotion model and its input batches live on this device/precision
+DEVICE, DTYPE = select_device(settings.INFERENCE_DEVICE)
+
+def warmup():
+    """Run one dummy face through the emotion model so its first forward pass happens at startup"""
+    _predict_emotions([np.zeros((224, 224, 3), dtype=np.uint8)])
+
 def analyze_emotion(image_path: str) -> tuple:
     """
-    Analyze emotion in image
+    Analyze emotion in image file (reads the file and delegates to analyze_emotion_bytes)
     
     Returns:
         (dominant_emotion, emotion_distribution_dict, confidence)
     """
     try:
-        # Load image
-        image = Image.open(image_path).convert('RGB')
-        
-        # Placeholder: In real implementation, load ViT model
-        # For now, return mock results
-        
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+    except OSError as e:
+        logger.error("Emotion analysis error: %s", e)
+        return 'neutral', {}, 0.0
+    
+    return analyze_emotion_bytes(image_data)
+
+def analyze_emotion_bytes(image_data: bytes) -> tuple:
+    """
+    Analyze emotion in an in-memory encoded image (JPG/PNG bytes)
+    
+    Returns:
+        (dominant_emotion, emotion_distribution_dict, confidence)
+    """
+    try:
+        # Decode image (BGR)
+        image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("could not decode image")
+        return analyze_image_emotion(image)
+    except Exception as e:
+        logger.error("Emotion analysis error: %s", e)
+        return 'neutral', {}, 0.0
+
+def analyze_image_emotion(image: np.ndarray) -> tuple:
+    """
+    Analyze emotion in a decoded BGR numpy array (full frame or face crop)
+    
+    Returns:
+        (dominant_emotion, emotion_distribution_dict, confidence)
+    """
+    return analyze_face_emotions([image])[0]
+
+def analyze_face_emotions(face_images: list) -> list:
+    """
+    Analyze emotion for several cropped faces in one batched model call
+    
+    Returns:
+        [(dominant_emotion, emotion_distribution_dict, confidence), ...] in input order
+    """
+    try:
+        # BGR -> RGB as zero-copy views
+        images = [face[:, :, ::-1] for face in face_images]
+        return _predict_emotions(images)
+    except Exception as e:
+        logger.error("Emotion analysis error: %s", e)
+        return [('neutral', {}, 0.0) for _ in face_images]
+
+def _predict_emotions(images: list) -> list:
+    """Run the emotion model on a batch of RGB numpy images (one forward pass)"""
+    # Placeholder: In real implementation, stack the images into one
+    # (B, 3, H, W) tensor, move it with .to(DEVICE, DTYPE) and run the ViT
+    # model (loaded once with .to(DEVICE, DTYPE).eval()) under
+    # torch.inference_mode(). For now, return mock results
+    results = []
+    for image in images:
         # Mock emotion distribution
         emotion_dist = {
             'happy': 0.45,
@@ -37,13 +119,42 @@ def analyze_emotion(image_path: str) -> tuple:
         dominant_emotion = max(emotion_dist, key=emotion_dist.get)
         confidence = emotion_dist[dominant_emotion]
         
-        logger.info(f"Emotion analyzed: {dominant_emotion} ({confidence*100:.1f}%)")
-        
-        return dominant_emotion, emotion_dist, confidence
+        logger.info("Emotion analyzed: %s (%.1f%%)", dominant_emotion, confidence*100)
         
-    except Exception as e:
-        logger.error(f"Emotion analysis error: {e}")
-        return 'neutral', {}, 0.0
+        results.append((dominant_emotion, emotion_dist, confidence))
+    
+    return results
+
+def average_emotions(distributions: list) -> tuple:
+    """
+    Average per-face emotion distributions with a single NumPy reduction
+    
+    A label missing from a face counts as 0 for that face; labels outside
+    EMOTION_LABELS are averaged too and kept in the distribution.
+    
+    Returns:
+        (dominant_emotion, emotion_confidence, emotion_distribution);
+        ('neutral', 0.0, {}) when no face has any probability mass (e.g. every
+        analysis failed and returned an empty distribution)
+    """
+    if not distributions:
+        return 'neutral', 0.0, {}
+    
+    # Known labels in their fixed order, then any others the model reported
+    extra = sorted({label for dist in distributions for label in dist} - set(EMOTION_LABELS))
+    labels = EMOTION_LABELS + extra
+    
+    # (N, L) matrix aligned to `labels`; missing labels count as 0
+    probs = np.array(
+        [[dist.get(label, 0.0) for label in labels] for dist in distributions],
+        dtype=np.float64,
+    )
+    avg = probs.mean(axis=0)
+    if avg.max() <= 0:
+        return 'neutral', 0.0, {}
+    idx = int(avg.argmax())
+    
+    return labels[idx], float(avg[idx]), dict(zip(labels, avg.tolist()))
 
 def aggregate_emotions(emotion_results: list) -> tuple:
     """
@@ -72,6 +183,6 @@ def aggregate_emotions(emotion_results: list) -> tuple:
         for emotion, count in emotion_counts.items()
     }
     
-    logger.info(f"Aggregated emotion: {dominant_emotion} ({emotion_confidence*100:.1f}%)")
+    logger.info("Aggregated emotion: %s (%.1f%%)", dominant_emotion, emotion_confidence*100)
     
     return dominant_emotion, emotion_confidence, emotion_distribution
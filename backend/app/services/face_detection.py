@@ -5,11 +5,21 @@ import numpy as np
 CASCADE_PATH = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
 face_cascade = cv2.CascadeClassifier(CASCADE_PATH)
 
+def warmup():
+    """Run the cascade once on a blank frame so the first request doesn't pay its setup cost."""
+    detect_faces_in_image(np.zeros((160, 160, 3), dtype=np.uint8))
+
+def decode_image(image_bytes: bytes):
+    """Decode JPG/PNG bytes straight into a BGR numpy array (None if undecodable)."""
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
 def detect_faces(image_bytes: bytes):
     """Return list of cropped face images (as numpy arrays)."""
     # Convert bytes → np array → BGR image
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    return detect_faces_in_image(decode_image(image_bytes))
+
+def detect_faces_in_image(img: np.ndarray):
+    """Return list of cropped face images from an already-decoded BGR image, largest face first."""
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     faces = face_cascade.detectMultiScale(
         gray,
@@ -19,7 +29,7 @@ def detect_faces(image_bytes: bytes):
     )
     
     crops = []
-    for (x, y, w, h) in faces:
+    for (x, y, w, h) in sorted(faces, key=lambda box: box[2] * box[3], reverse=True):
         face = img[y:y + h, x:x + w]
         crops.append(face)
     return crops
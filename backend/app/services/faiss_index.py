@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, saves are unlocked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+# Below this many vectors an exact inner-product scan is faster than training
+# and probing an IVF index; above it, use IVF-PQ to bound search cost and memory
+IVF_MIN_VECTORS = 50_000
+IVF_PQ_SPEC = "IVF{nlist},PQ32x8"
+IVF_NPROBE = 16
+
+class _ReadWriteLock:
+    """Many concurrent readers (searches) or one writer (build/add/remove); waiting writers go first"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+# Lazy load FAISS (only when needed, not at import)
+_index = None
+# FAISS id -> session_id; ids are derived from the session_id (face_id), so
+# every worker assigns the same id to the same session
+_labels: Dict[int, str] = {}
+# When the index last caught up with the database (ISO timestamp); rows
+# created after this are re-read by the next sync
+_synced_at: Optional[str] = None
+# FAISS searches are thread-safe against each other but not against add/remove
+_lock = _ReadWriteLock()
+
+def face_id(session_id: str) -> int:
+    """Stable non-negative int64 FAISS id for a session"""
+    digest = hashlib.blake2b(session_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+def _as_vectors(embeddings: np.ndarray) -> np.ndarray:
+    """
+    View embeddings as float32, C-contiguous rows (no copy when already so)
+    
+    Embeddings are L2-normalized once at capture (embedding.extract_embeddings),
+    so inner product is cosine similarity and nothing is re-normalized here.
+    """
+    return np.ascontiguousarray(np.atleast_2d(embeddings), dtype=np.float32)
+
+def _new_index(vectors: np.ndarray):
+    """Create an empty index sized for the given training vectors"""
+    import faiss
+
+    if len(vectors) < IVF_MIN_VECTORS:
+        return faiss.IndexIDMap(faiss.IndexFlatIP(EMBEDDING_DIM))
+
+    nlist = int(4 * np.sqrt(len(vectors)))
+    index = faiss.index_factory(EMBEDDING_DIM, IVF_PQ_SPEC.format(nlist=nlist), faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.nprobe = IVF_NPROBE
+    return index
+
+def build_index(rows: Iterable[Tuple[str, np.ndarray]], synced_at: Optional[str] = None) -> int:
+    """
+    (Re)build the index from (session_id, embedding) pairs
+
+    Returns:
+        Number of vectors indexed
+    """
+    global _index, _labels, _synced_at
+
+    labels = {}
+    embeddings = []
+    for session_id, embedding in rows:
+        if face_id(session_id) not in labels:
+            labels[face_id(session_id)] = session_id
+            embeddings.append(embedding)
+
+    vectors = _as_vectors(np.vstack(embeddings)) if embeddings else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    index = _new_index(vectors)
+    if len(vectors):
+        index.add_with_ids(vectors, np.fromiter(labels, dtype=np.int64, count=len(labels)))
+
+    with _lock.write():
+        _index = index
+        _labels = labels
+        _synced_at = synced_at
+
+    logger.info("Face index built: %s vectors", len(labels))
+    return len(labels)
+
+def add_embedding(session_id: str, embedding: np.ndarray):
+    """Add one face embedding to the index"""
+    add_embeddings([(session_id, embedding)])
+
+def add_embeddings(rows: Iterable[Tuple[str, np.ndarray]], synced_at: Optional[str] = None) -> int:
+    """
+    Add (session_id, embedding) pairs in one batch, skipping sessions already indexed
+
+    Returns:
+        Number of vectors added
+    """
+    global _index, _synced_at
+
+    rows = [(face_id(session_id), session_id, embedding) for session_id, embedding in rows]
+    with _lock.write():
+        new_rows = {}
+        for idx, session_id, embedding in rows:
+            if idx not in _labels and idx not in new_rows:
+                new_rows[idx] = (session_id, embedding)
+        if new_rows:
+            vectors = _as_vectors(np.vstack([embedding for _, embedding in new_rows.values()]))
+            if _index is None:
+                _index = _new_index(vectors)
+            _index.add_with_ids(vectors, np.fromiter(new_rows, dtype=np.int64, count=len(new_rows)))
+            _labels.update((idx, session_id) for idx, (session_id, _) in new_rows.items())
+        if synced_at is not None:
+            _synced_at = synced_at
+
+    return len(new_rows)
+
+def remove(session_ids: Iterable[str]) -> int:
+    """
+    Drop sessions (deleted or expired) from the index
+
+    Returns:
+        Number of vectors removed
+    """
+    with _lock.write():
+        ids = [face_id(session_id) for session_id in session_ids if face_id(session_id) in _labels]
+        if not ids:
+            return 0
+        _index.remove_ids(np.array(ids, dtype=np.int64))
+        for idx in ids:
+            del _labels[idx]
+
+    logger.info("Face index: removed %s stale vectors", len(ids))
+    return len(ids)
+
+def synced_at() -> Optional[str]:
+    """When the index last caught up with the database (None before the first build)"""
+    return _synced_at
+
+def save(path: str) -> bool:
+    """
+    Write the index, its labels and sync time to `path` as one file
+
+    Everything goes into a single .npz written to a per-process temp file and
+    renamed into place, so a reader never sees vectors and labels from two
+    different writers. Workers share the path; a non-blocking file lock lets
+    one of them write and the others skip. Without fcntl (Windows) there is
+    no lock: concurrent workers each write a whole file and the last rename wins.
+
+    Returns:
+        False if there is no index to save or another worker is saving
+    """
+    import faiss
+
+    with _lock.read():
+        if _index is None:
+            return False
+        data = faiss.serialize_index(_index)
+        labels = np.array(list(_labels.values()), dtype=str)
+        synced = _synced_at or ""
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "w") as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Face index save skipped: another worker is writing %s", path)
+            return False
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, index=data, labels=labels, synced_at=np.array(synced))
+        os.replace(tmp_path, path)
+
+    logger.info("Face index saved: %s vectors -> %s", len(labels), path)
+    return True
+
+def load(path: str) -> Optional[str]:
+    """
+    Load an index written by save()
+
+    Returns:
+        The saved sync timestamp, or None if there is no usable cache
+        (the caller then rebuilds from the database)
+    """
+    global _index, _labels, _synced_at
+
+    if not os.path.exists(path):
+        return None
+
+    import faiss
+
+    try:
+        with np.load(path, allow_pickle=False) as cache:
+            index = faiss.deserialize_index(cache["index"])
+            labels = cache["labels"].tolist()
+            synced = str(cache["synced_at"])
+    except Exception as e:
+        logger.warning("Ignoring unreadable face index cache %s: %s", path, e)
+        return None
+
+    if index.ntotal != len(labels) or not synced:
+        logger.warning("Ignoring inconsistent face index cache %s", path)
+        return None
+
+    # A flat index saved while the gallery was small is retrained as IVF-PQ
+    # (full rebuild) once it has grown past the threshold
+    if not isinstance(index, faiss.IndexIVF) and index.ntotal >= IVF_MIN_VECTORS:
+        logger.info("Face index cache %s outgrew the flat index; rebuilding", path)
+        return None
+
+    with _lock.write():
+        _index = index
+        _labels = {face_id(session_id): session_id for session_id in labels}
+        _synced_at = synced
+
+    logger.info("Face index loaded: %s vectors from %s", len(_labels), path)
+    return _synced_at
+
+def search(embedding: np.ndarray, limit: int, threshold: float) -> List[Tuple[str, float]]:
+    """
+    Find the closest indexed faces by cosine similarity
+
+    Returns:
+        [(session_id, similarity_score), ...] with score >= threshold, best first
+    """
+    with _lock.read():
+        if _index is None or not _labels:
+            return []
+        scores, ids = _index.search(_as_vectors(embedding), min(limit, len(_labels)))
+        return [
+            (_labels[idx], float(score))
+            for score, idx in zip(scores[0], ids[0])
+            if idx >= 0 and score >= threshold
+        ]
@@ -1,13 +1,18 @@
 import os
 import uuid
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
 import shutil
 from app.config import settings
+from app.utils.validators import IMAGE_EXTENSIONS
 
 logger = logging.getLogger(__name__)
 
+# Max concurrent directory removals during cleanup
+CLEANUP_WORKERS = 8
+
 class LocalImageStorage:
     """Handle local file storage for images"""
     
@@ -26,24 +31,24 @@ class LocalImageStorage:
         ]
         for dir_path in dirs:
             Path(dir_path).mkdir(parents=True, exist_ok=True)
-            logger.info(f"✅ Directory ready: {dir_path}")
+            logger.info("✅ Directory ready: %s", dir_path)
     
-    def save_session_image(self, image_data: bytes, session_id: str) -> str:
-        """Save session captured image"""
+    def save_session_image(self, image_data: bytes, session_id: str, image_type: str = "jpeg") -> str:
+        """Save session captured image (`image_type` as returned by sniff_image_type)"""
         try:
             session_dir = os.path.join(self.base_dir, 'sessions', session_id)
             Path(session_dir).mkdir(parents=True, exist_ok=True)
             
-            filename = f"captured_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            filename = f"captured_{uuid.uuid4().hex[:12]}{IMAGE_EXTENSIONS[image_type]}"
             filepath = os.path.join(session_dir, filename)
             
             with open(filepath, 'wb') as f:
                 f.write(image_data)
             
-            logger.info(f"✅ Session image saved: {filepath}")
+            logger.info("✅ Session image saved: %s", filepath)
             return filepath
         except Exception as e:
-            logger.error(f"❌ Error saving session image: {e}")
+            logger.error("❌ Error saving session image: %s", e)
             raise
     
     def save_face_crop(self, image_data: bytes, session_id: str, face_id: str) -> str:
@@ -52,16 +57,16 @@ class LocalImageStorage:
             faces_dir = os.path.join(self.base_dir, 'faces', session_id)
             Path(faces_dir).mkdir(parents=True, exist_ok=True)
             
-            filename = f"face_{face_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            filename = f"face_{face_id}_{uuid.uuid4().hex[:12]}.jpg"
             filepath = os.path.join(faces_dir, filename)
             
             with open(filepath, 'wb') as f:
                 f.write(image_data)
             
-            logger.info(f"✅ Face crop saved: {filepath}")
+            logger.info("✅ Face crop saved: %s", filepath)
             return filepath
         except Exception as e:
-            logger.error(f"❌ Error saving face crop: {e}")
+            logger.error("❌ Error saving face crop: %s", e)
             raise
     
     def get_session_files(self, session_id: str) -> list:
@@ -72,17 +77,17 @@ class LocalImageStorage:
                 return []
             
             files = []
-            for filename in os.listdir(session_dir):
-                filepath = os.path.join(session_dir, filename)
-                files.append({
-                    'name': filename,
-                    'path': filepath,
-                    'size': os.path.getsize(filepath)
-                })
+            with os.scandir(session_dir) as entries:
+                for entry in entries:
+                    files.append({
+                        'name': entry.name,
+                        'path': entry.path,
+                        'size': entry.stat().st_size
+                    })
             
             return files
         except Exception as e:
-            logger.error(f"Error getting session files: {e}")
+            logger.error("Error getting session files: %s", e)
             return []
     
     def delete_session_files(self, session_id: str) -> bool:
@@ -93,58 +98,61 @@ class LocalImageStorage:
             
             if os.path.exists(session_dir):
                 shutil.rmtree(session_dir)
-                logger.info(f"✅ Deleted session directory: {session_dir}")
+                logger.info("✅ Deleted session directory: %s", session_dir)
             
             if os.path.exists(faces_dir):
                 shutil.rmtree(faces_dir)
-                logger.info(f"✅ Deleted faces directory: {faces_dir}")
+                logger.info("✅ Deleted faces directory: %s", faces_dir)
             
             return True
         except Exception as e:
-            logger.error(f"❌ Error deleting session files: {e}")
+            logger.error("❌ Error deleting session files: %s", e)
             return False
     
     def cleanup_old_sessions(self, hours: int = 24) -> int:
         """Delete sessions older than specified hours"""
         try:
-            from datetime import datetime, timedelta
             import time
             
             session_dir = os.path.join(self.base_dir, 'sessions')
             cutoff_time = time.time() - (hours * 3600)
-            deleted_count = 0
             
+            # Collect stale sessions first, then remove them concurrently
+            stale_sessions = []
             if os.path.exists(session_dir):
-                for session_id in os.listdir(session_dir):
-                    session_path = os.path.join(session_dir, session_id)
-                    if os.path.isdir(session_path):
-                        mod_time = os.path.getmtime(session_path)
-                        if mod_time < cutoff_time:
-                            shutil.rmtree(session_path)
-                            deleted_count += 1
-                            logger.info(f"🧹 Cleanup: Deleted old session {session_id}")
+                with os.scandir(session_dir) as entries:
+                    for entry in entries:
+                        if entry.is_dir() and entry.stat().st_mtime < cutoff_time:
+                            stale_sessions.append(entry)
+            
+            if stale_sessions:
+                with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+                    list(executor.map(shutil.rmtree, [entry.path for entry in stale_sessions]))
+                for entry in stale_sessions:
+                    logger.info("🧹 Cleanup: Deleted old session %s", entry.name)
             
-            logger.info(f"🧹 Cleanup complete: Deleted {deleted_count} old sessions")
+            deleted_count = len(stale_sessions)
+            logger.info("🧹 Cleanup complete: Deleted %s old sessions", deleted_count)
             return deleted_count
         except Exception as e:
-            logger.error(f"Error during cleanup: {e}")
+            logger.error("Error during cleanup: %s", e)
             return 0
 
 # Singleton instance
 storage = LocalImageStorage()
 
-# Public functions
-async def save_session_image(image_data: bytes, session_id: str) -> str:
-    return storage.save_session_image(image_data, session_id)
+# Public functions (blocking filesystem work runs in a worker thread)
+async def save_session_image(image_data: bytes, session_id: str, image_type: str = "jpeg") -> str:
+    return await asyncio.to_thread(storage.save_session_image, image_data, session_id, image_type)
 
 async def save_face_crop(image_data: bytes, session_id: str, face_id: str) -> str:
-    return storage.save_face_crop(image_data, session_id, face_id)
+    return await asyncio.to_thread(storage.save_face_crop, image_data, session_id, face_id)
 
 async def get_session_files(session_id: str) -> list:
-    return storage.get_session_files(session_id)
+    return await asyncio.to_thread(storage.get_session_files, session_id)
 
 async def delete_session_files(session_id: str) -> bool:
-    return storage.delete_session_files(session_id)
+    return await asyncio.to_thread(storage.delete_session_files, session_id)
 
 async def cleanup_old_sessions(hours: int = 24) -> int:
-    return storage.cleanup_old_sessions(hours)
+    return await asyncio.to_thread(storage.cleanup_old_sessions, hours)
@@ -1,5 +1,5 @@
 import boto3
-import base64
+import binascii
 import logging
 from io import BytesIO
 from app.config import settings
@@ -16,10 +16,9 @@ s3_client = boto3.client(
 async def upload_image_to_s3(base64_image: str, session_id: str) -> str:
     """Upload base64 image to S3"""
     try:
-        # Decode base64
-        if ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
-        image_data = base64.b64decode(base64_image)
+        # Decode base64 (strip a "data:image/...;base64," prefix if present)
+        _, _, payload = base64_image.rpartition(',')
+        image_data = binascii.a2b_base64(payload)
         
         # Upload to S3
         key = f"sessions/{session_id}/captured.jpg"
@@ -30,8 +29,8 @@ async def upload_image_to_s3(base64_image: str, session_id: str) -> str:
             ContentType='image/jpeg',
         )
         
-        logger.info(f"Image uploaded to S3: {key}")
+        logger.info("Image uploaded to S3: %s", key)
         return f"s3://{settings.AWS_S3_BUCKET}/{key}"
     except Exception as e:
-        logger.error(f"S3 upload error: {e}")
+        logger.error("S3 upload error: %s", e)
         raise
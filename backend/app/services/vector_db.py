@@ -1,35 +1,49 @@
 import os
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 from datetime import datetime
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Dummy query vector for metadata-filtered lookups
+_ZERO_VECTOR = [0.0] * 512
+
 # Lazy load Pinecone (only when needed, not at import)
 _pc = None
 _index = None
+_disabled = False
 
 def _get_pinecone():
     """Initialize Pinecone only when first needed"""
-    global _pc, _index
-    if _pc is None:
+    global _pc, _index, _disabled
+    if _pc is None and not _disabled:
+        api_key = os.environ.get("PINECONE_API_KEY")
+        if not api_key:
+            # Remember the decision so later calls skip the env lookup and warning
+            logger.warning("PINECONE_API_KEY not set - vector DB disabled")
+            _disabled = True
+            return None, None
+        
         try:
             from pinecone import Pinecone
-            api_key = os.environ.get("PINECONE_API_KEY")
-            if not api_key:
-                logger.warning("PINECONE_API_KEY not set - vector DB disabled")
-                return None, None
             
             _pc = Pinecone(api_key=api_key)
             _index = _pc.Index(os.environ.get("PINECONE_INDEX"))
             logger.info("Pinecone initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize Pinecone: {e}")
+            logger.error("Failed to initialize Pinecone: %s", e)
             return None, None
     
     return _pc, _index
 
-async def store_embedding(session_id: str, embedding: List[float], metadata: Dict[str, Any]) -> str:
+def _as_values(embedding: Union[np.ndarray, List[float]]) -> List[float]:
+    """Convert an embedding to the plain float list the Pinecone client sends"""
+    if isinstance(embedding, np.ndarray):
+        return embedding.tolist()
+    return embedding
+
+async def store_embedding(session_id: str, embedding: Union[np.ndarray, List[float]], metadata: Dict[str, Any]) -> str:
     """Store face embedding in Pinecone"""
     try:
         pc, index = _get_pinecone()
@@ -43,17 +57,17 @@ async def store_embedding(session_id: str, embedding: List[float], metadata: Dic
         # Upsert vector to Pinecone
         index.upsert(
             vectors=[
-                (vector_id, embedding, metadata)
+                (vector_id, _as_values(embedding), metadata)
             ]
         )
         
-        logger.info(f"Stored embedding: {vector_id}")
+        logger.info("Stored embedding: %s", vector_id)
         return vector_id
     except Exception as e:
-        logger.error(f"Error storing embedding: {e}")
+        logger.error("Error storing embedding: %s", e)
         raise
 
-async def search_similar_faces(embedding: List[float], top_k: int = 10) -> List[Dict]:
+async def search_similar_faces(embedding: Union[np.ndarray, List[float]], top_k: int = 10) -> List[Dict]:
     """Search for similar face embeddings"""
     try:
         pc, index = _get_pinecone()
@@ -63,7 +77,7 @@ async def search_similar_faces(embedding: List[float], top_k: int = 10) -> List[
         
         # Query Pinecone
         results = index.query(
-            vector=embedding,
+            vector=_as_values(embedding),
             top_k=top_k,
             include_metadata=True
         )
@@ -77,10 +91,10 @@ async def search_similar_faces(embedding: List[float], top_k: int = 10) -> List[
                 'metadata': match['metadata']
             })
         
-        logger.info(f"Found {len(matches)} similar faces")
+        logger.info("Found %s similar faces", len(matches))
         return matches
     except Exception as e:
-        logger.error(f"Error searching embeddings: {e}")
+        logger.error("Error searching embeddings: %s", e)
         raise
 
 async def delete_session_vectors(session_id: str) -> bool:
@@ -93,7 +107,7 @@ async def delete_session_vectors(session_id: str) -> bool:
         
         # Query by metadata
         results = index.query(
-            vector=[0] * 512,  # Dummy vector
+            vector=_ZERO_VECTOR,
             top_k=10000,
             filter={"session_id": {"$eq": session_id}},
             include_metadata=True
@@ -103,9 +117,9 @@ async def delete_session_vectors(session_id: str) -> bool:
         vector_ids = [match['id'] for match in results.get('matches', [])]
         if vector_ids:
             index.delete(ids=vector_ids)
-            logger.info(f"Deleted {len(vector_ids)} vectors for session {session_id}")
+            logger.info("Deleted %s vectors for session %s", len(vector_ids), session_id)
         
         return True
     except Exception as e:
-        logger.error(f"Error deleting vectors: {e}")
+        logger.error("Error deleting vectors: %s", e)
         raise
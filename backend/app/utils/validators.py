@@ -0,0 +1,37 @@
+from typing import Optional
+
+# Magic-byte prefixes of the image formats the decoder accepts
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "jpeg",
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"RIFF": "webp",
+}
+
+# File extension for each sniffed format, and the media type it is served with
+IMAGE_EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+IMAGE_MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+# Enough leading bytes to identify every format above (WEBP needs 12)
+SNIFF_BYTES = 12
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """
+    Identify an image format from its leading bytes
+    
+    Args:
+        header: First SNIFF_BYTES (or more) bytes of the file
+    
+    Returns:
+        "jpeg", "png" or "webp", or None if the bytes are not a supported image
+    """
+    for signature, kind in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            # RIFF is a generic container; only RIFF....WEBP is an image
+            if kind == "webp" and header[8:12] != b"WEBP":
+                return None
+            return kind
+    return None
+
+def is_image_content_type(content_type: Optional[str]) -> bool:
+    """Cheap pre-filter on the client-declared MIME type (missing types pass)"""
+    return not content_type or content_type.startswith("image/") or content_type == "application/octet-stream"
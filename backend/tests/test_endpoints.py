@@ -0,0 +1,313 @@
+import asyncio
+import io
+import sys
+import types
+import uuid
+
+import numpy as np
+import pytest
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+
+from app.config import settings
+from app.middleware.gzip_json import JSONGZipMiddleware
+from app.middleware.upload_limit import MULTIPART_OVERHEAD_BYTES, UploadLimitMiddleware
+from app.routes import search
+from app.routes.search import read_upload
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + b"\x00" * 2048
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 2048
+
+
+def make_upload(data: bytes, content_type: str = "image/jpeg") -> UploadFile:
+    return UploadFile(
+        file=io.BytesIO(data),
+        size=len(data),
+        filename="face.jpg",
+        headers=Headers({"content-type": content_type}),
+    )
+
+
+# ==================== read_upload ====================
+
+@pytest.mark.parametrize("data, image_type", [(JPEG_BYTES, "jpeg"), (PNG_BYTES, "png")])
+def test_read_upload_returns_image_bytes_and_type(data, image_type):
+    assert asyncio.run(read_upload(make_upload(data))) == (data, image_type)
+
+
+def test_read_upload_rejects_non_image_content_type():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(read_upload(make_upload(JPEG_BYTES, content_type="text/plain")))
+    assert exc.value.status_code == 415
+
+
+def test_read_upload_rejects_non_image_bytes():
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(read_upload(make_upload(b"GIF89a" + b"\x00" * 64)))
+    assert exc.value.status_code == 415
+
+
+def test_read_upload_rejects_declared_oversize(monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 1024)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(read_upload(make_upload(JPEG_BYTES)))
+    assert exc.value.status_code == 413
+
+
+def test_read_upload_rejects_oversize_while_streaming(monkeypatch):
+    # No declared size: the cap is enforced on the bytes actually read
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 100 * 1024)
+    data = b"\xff\xd8\xff" + b"\x00" * (200 * 1024)
+
+    upload = UploadFile(file=io.BytesIO(data), headers=Headers({"content-type": "image/jpeg"}))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(read_upload(upload))
+    assert exc.value.status_code == 413
+
+
+# ==================== UploadLimitMiddleware ====================
+
+@pytest.fixture
+def limited_client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload():
+        return {"ok": True}
+
+    app.add_middleware(UploadLimitMiddleware, max_body_bytes=1024)
+    return TestClient(app)
+
+
+def test_upload_limit_rejects_large_content_length(limited_client):
+    response = limited_client.post(
+        "/upload", content=b"x", headers={"Content-Length": str(1024 + MULTIPART_OVERHEAD_BYTES + 1)}
+    )
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "Image too large"}
+
+
+def test_upload_limit_allows_body_within_cap(limited_client):
+    response = limited_client.post("/upload", content=b"x" * 1024)
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+
+
+# ==================== POST /v1/analyze-face ====================
+
+@pytest.fixture
+def analyze_client(monkeypatch):
+    """
+    Client for analyze-face with the handler's service imports replaced
+
+    Returns (make_client, stored): make_client(emotion_results, matches) builds
+    a client whose emotion model returns `emotion_results` for the detected
+    faces and whose similarity search returns `matches`; `stored` collects the
+    sessions scheduled for persistence.
+    """
+    stored = []
+
+    async def save_session_image(image_data, session_id, image_type):
+        return f"/tmp/{session_id}/captured.{image_type}"
+
+    monkeypatch.setattr(search, "store_session_data", lambda **kwargs: stored.append(kwargs))
+    search.FACE_ANALYSIS_CACHE.clear()
+
+    def make_client(emotion_results, matches=()):
+        services = {
+            "app.services.face_detection": {
+                "decode_image": lambda data: np.zeros((160, 160, 3), dtype=np.uint8),
+                "detect_faces_in_image": lambda image: [image] * len(emotion_results),
+            },
+            "app.services.emotion": {
+                "analyze_face_emotions": lambda faces: list(emotion_results),
+            },
+            "app.services.embedding": {
+                "extract_embeddings": lambda faces: np.zeros((len(faces), 512), dtype=np.float32),
+            },
+            "app.services.image_storage": {
+                "save_session_image": save_session_image,
+            },
+            "app.services.database": {
+                "get_matched_images": lambda **kwargs: [dict(match) for match in matches],
+            },
+        }
+        for name, attrs in services.items():
+            module = types.ModuleType(name)
+            module.__dict__.update(attrs)
+            monkeypatch.setitem(sys.modules, name, module)
+
+        app = FastAPI()
+        app.include_router(search.router)
+        return TestClient(app)
+
+    return make_client, stored
+
+
+def post_face(client):
+    return client.post(
+        "/v1/analyze-face",
+        files={"image": ("face.jpg", JPEG_BYTES, "image/jpeg")},
+        data={"user_name": "Test", "privacy_agreed": "true"},
+    )
+
+
+FAILED = ("neutral", {}, 0.0)
+HAPPY = ("happy", {"happy": 0.8, "neutral": 0.2}, 0.8)
+
+
+@pytest.mark.parametrize("emotion_results", [[FAILED], [FAILED, FAILED], [HAPPY, FAILED]])
+def test_analyze_face_rejects_failed_emotion_analysis(analyze_client, emotion_results):
+    make_client, stored = analyze_client
+
+    response = post_face(make_client(emotion_results))
+
+    assert response.status_code == 400
+    assert response.json()["success"] is False
+    assert response.json()["error"] == "Could not analyze image"
+    assert stored == []
+
+
+def test_analyze_face_stores_successful_analysis(analyze_client):
+    make_client, stored = analyze_client
+
+    response = post_face(make_client([HAPPY]))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert body["dominant_emotion"] == "happy"
+    assert [call["session_id"] for call in stored] == [body["session_id"]]
+
+
+def test_analyze_face_returns_absolute_similar_image_urls(analyze_client):
+    make_client, _ = analyze_client
+    match_id = "0" * 32
+
+    response = post_face(make_client([HAPPY], matches=[{"image_id": match_id, "similarity_score": 0.9}]))
+
+    assert response.status_code == 200
+    assert response.json()["similar_faces"] == [{
+        "image_id": match_id,
+        "similarity_score": 0.9,
+        "image_url": f"http://testserver/v1/sessions/{match_id}/image",
+    }]
+
+
+# ==================== GET /v1/sessions/{id}/image ====================
+
+@pytest.fixture
+def session_files(monkeypatch, tmp_path):
+    """Replace session image storage with the files saved under the returned directory"""
+    async def get_session_files(session_id):
+        return [{"name": p.name, "path": str(p), "size": p.stat().st_size} for p in tmp_path.iterdir()]
+
+    module = types.ModuleType("app.services.image_storage")
+    module.get_session_files = get_session_files
+    monkeypatch.setitem(sys.modules, "app.services.image_storage", module)
+    return tmp_path
+
+
+@pytest.fixture
+def image_client(session_files):
+    app = FastAPI()
+    app.include_router(search.router)
+    return TestClient(app), session_files
+
+
+@pytest.mark.parametrize("filename, data, media_type", [
+    ("captured_0.jpg", JPEG_BYTES, "image/jpeg"),
+    ("captured_0.png", PNG_BYTES, "image/png"),
+])
+def test_session_image_media_type_follows_saved_format(image_client, filename, data, media_type):
+    client, storage_dir = image_client
+    (storage_dir / filename).write_bytes(data)
+
+    response = client.get(f"/v1/sessions/{uuid.uuid4().hex}/image")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == media_type
+    assert response.content == data
+
+
+def test_session_image_rejects_invalid_session_id(image_client):
+    client, _ = image_client
+
+    assert client.get("/v1/sessions/not-a-session/image").status_code == 404
+
+
+# ==================== JSONGZipMiddleware ====================
+
+@pytest.fixture
+def gzip_client(session_files):
+    app = FastAPI()
+    app.include_router(search.router)
+
+    @app.get("/json")
+    async def json_body(items: int):
+        return {"similar_faces": [{"image_id": uuid.uuid4().hex} for _ in range(items)]}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                yield b'{"chunk": "' + b"x" * 2048 + b'"}'
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    app.add_middleware(JSONGZipMiddleware, minimum_size=1024)
+    return TestClient(app), session_files
+
+
+def test_gzip_compresses_large_json(gzip_client):
+    client, _ = gzip_client
+
+    response = client.get("/json", params={"items": 100}, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()["similar_faces"]) == 100
+
+
+def test_gzip_compresses_streamed_json(gzip_client):
+    client, _ = gzip_client
+
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == (b'{"chunk": "' + b"x" * 2048 + b'"}') * 3
+
+
+def test_gzip_skips_small_json(gzip_client):
+    client, _ = gzip_client
+
+    response = client.get("/json", params={"items": 1}, headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert len(response.json()["similar_faces"]) == 1
+
+
+def test_gzip_skips_clients_without_gzip(gzip_client):
+    client, _ = gzip_client
+
+    response = client.get("/json", params={"items": 100}, headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_gzip_skips_session_images(gzip_client):
+    client, storage_dir = gzip_client
+    (storage_dir / "captured_0.jpg").write_bytes(JPEG_BYTES)
+
+    response = client.get(f"/v1/sessions/{uuid.uuid4().hex}/image", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content == JPEG_BYTES
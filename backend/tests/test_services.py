@@ -0,0 +1,184 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from app.utils.validators import SNIFF_BYTES, is_image_content_type, sniff_image_type
+
+
+# ==================== UPLOAD VALIDATION ====================
+
+@pytest.mark.parametrize("header, expected", [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\r", "png"),
+    (b"RIFF\x24\x00\x00\x00WEBP", "webp"),
+])
+def test_sniff_image_type_accepts_supported_formats(header, expected):
+    assert sniff_image_type(header[:SNIFF_BYTES]) == expected
+
+
+@pytest.mark.parametrize("header", [
+    b"RIFF\x24\x00\x00\x00WAVE",  # RIFF container that isn't WEBP
+    b"GIF89a\x01\x00\x01\x00\x00\x00",
+    b"%PDF-1.7\n%\xe2\xe3",
+    b"\x89PN",  # truncated PNG signature
+    b"",
+])
+def test_sniff_image_type_rejects_other_content(header):
+    assert sniff_image_type(header) is None
+
+
+@pytest.mark.parametrize("content_type, allowed", [
+    ("image/jpeg", True),
+    ("image/webp", True),
+    ("application/octet-stream", True),
+    (None, True),
+    ("", True),
+    ("text/plain", False),
+    ("application/pdf", False),
+])
+def test_is_image_content_type(content_type, allowed):
+    assert is_image_content_type(content_type) is allowed
+
+
+# ==================== IMAGE STORAGE ====================
+
+@pytest.mark.parametrize("image_type, extension", [("jpeg", ".jpg"), ("png", ".png"), ("webp", ".webp")])
+def test_session_image_extension_follows_image_type(tmp_path, monkeypatch, image_type, extension):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "STORAGE_DIR", str(tmp_path))
+    from app.services.image_storage import LocalImageStorage
+
+    path = LocalImageStorage().save_session_image(b"image", uuid.uuid4().hex, image_type)
+
+    assert path.endswith(extension)
+    assert open(path, "rb").read() == b"image"
+
+
+# ==================== FACE INDEX ====================
+
+@pytest.fixture
+def face_index():
+    """faiss_index with empty module state, restored afterwards"""
+    pytest.importorskip("faiss")
+    from app.services import faiss_index
+
+    saved = (faiss_index._index, faiss_index._labels, faiss_index._synced_at)
+    faiss_index._index, faiss_index._labels, faiss_index._synced_at = None, {}, None
+    yield faiss_index
+    faiss_index._index, faiss_index._labels, faiss_index._synced_at = saved
+
+
+def make_embeddings(n, seed=0):
+    vectors = np.random.default_rng(seed).random((n, 512)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_face_index_build_and_search(face_index):
+    ids = [uuid.uuid4().hex for _ in range(3)]
+    vectors = make_embeddings(3)
+
+    assert face_index.build_index(zip(ids, vectors)) == 3
+
+    session_id, score = face_index.search(vectors[1], limit=1, threshold=0.0)[0]
+    assert session_id == ids[1]
+    assert score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_face_index_search_applies_threshold(face_index):
+    ids = [uuid.uuid4().hex for _ in range(3)]
+    vectors = make_embeddings(3)
+    face_index.build_index(zip(ids, vectors))
+
+    assert [sid for sid, _ in face_index.search(vectors[0], limit=3, threshold=0.9999)] == [ids[0]]
+
+
+def test_face_index_add_skips_known_sessions(face_index):
+    ids = [uuid.uuid4().hex for _ in range(3)]
+    vectors = make_embeddings(3)
+    face_index.build_index(zip(ids[:2], vectors[:2]), synced_at="2026-01-01T00:00:00")
+
+    added = face_index.add_embeddings(zip(ids, vectors), synced_at="2026-01-02T00:00:00")
+
+    assert added == 1
+    assert sorted(face_index._labels.values()) == sorted(ids)
+    assert face_index.synced_at() == "2026-01-02T00:00:00"
+
+
+def test_face_index_remove(face_index):
+    ids = [uuid.uuid4().hex for _ in range(3)]
+    vectors = make_embeddings(3)
+    face_index.build_index(zip(ids, vectors))
+
+    assert face_index.remove([ids[0], "not-indexed"]) == 1
+    assert ids[0] not in [sid for sid, _ in face_index.search(vectors[0], limit=3, threshold=0.0)]
+
+
+def test_face_index_save_load_round_trip(face_index, tmp_path):
+    ids = [uuid.uuid4().hex for _ in range(4)]
+    vectors = make_embeddings(4)
+    face_index.build_index(zip(ids[:3], vectors[:3]), synced_at="2026-01-01T00:00:00")
+    face_index.add_embedding(ids[3], vectors[3])
+    face_index.remove([ids[0]])
+    path = str(tmp_path / "cache" / "face_index.npz")
+
+    assert face_index.save(path)
+    face_index.build_index([])
+
+    assert face_index.load(path) == "2026-01-01T00:00:00"
+    assert sorted(face_index._labels.values()) == sorted(ids[1:])
+    for session_id, vector in zip(ids[1:], vectors[1:]):
+        assert face_index.search(vector, limit=1, threshold=0.0)[0][0] == session_id
+
+    # Catching up after a load only adds sessions the cache doesn't hold
+    assert face_index.add_embeddings(zip(ids, vectors)) == 1
+
+
+def test_face_index_load_without_cache(face_index, tmp_path):
+    assert face_index.load(str(tmp_path / "missing.npz")) is None
+
+
+def test_face_index_load_ignores_corrupt_cache(face_index, tmp_path):
+    path = tmp_path / "face_index.npz"
+    path.write_bytes(b"not an index")
+
+    assert face_index.load(str(path)) is None
+
+
+def test_face_index_load_rebuilds_outgrown_flat_index(face_index, tmp_path, monkeypatch):
+    ids = [uuid.uuid4().hex for _ in range(3)]
+    face_index.build_index(zip(ids, make_embeddings(3)), synced_at="2026-01-01T00:00:00")
+    path = str(tmp_path / "face_index.npz")
+    face_index.save(path)
+
+    monkeypatch.setattr(face_index, "IVF_MIN_VECTORS", 3)
+
+    assert face_index.load(path) is None
+
+
+def test_face_index_save_skips_while_another_writer_holds_the_lock(face_index, tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+
+    face_index.build_index(zip([uuid.uuid4().hex], make_embeddings(1)))
+    path = str(tmp_path / "face_index.npz")
+
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # flock locks belong to the open file description, so a second open()
+        # in this process contends like another worker would
+        assert face_index.save(path) is False
+
+    assert face_index.save(path) is True
+
+
+def test_face_index_save_without_fcntl(face_index, tmp_path, monkeypatch):
+    # Windows has no fcntl: the save goes ahead without the lock
+    monkeypatch.setattr(face_index, "fcntl", None)
+    ids = [uuid.uuid4().hex]
+    face_index.build_index(zip(ids, make_embeddings(1)), synced_at="2026-01-01T00:00:00")
+    path = str(tmp_path / "face_index.npz")
+
+    assert face_index.save(path) is True
+    assert face_index.load(path) == "2026-01-01T00:00:00"
+    assert list(face_index._labels.values()) == ids